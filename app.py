@@ -1,10 +1,18 @@
 # streamlit_app/app.py
 import streamlit as st
+import altair as alt
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import pandas as pd
 import json
 import io
-import matplotlib.pyplot as plt
+import orjson
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import ijson
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
 
 st.set_page_config(page_title="CLTV Predictor", layout="wide")
@@ -14,6 +22,12 @@ st.set_page_config(page_title="CLTV Predictor", layout="wide")
 DEFAULT_API_URL = "https://cltv-backend-shap.onrender.com"
 API_URL = st.secrets.get("STREAMLIT_API_URL", None) or DEFAULT_API_URL
 
+# Feature columns expected by the /predict endpoint
+FEATURES = (
+    "frequency", "total_spend", "aov", "recency_days", "T_days", "avg_interpurchase_days",
+    "active_months", "purchase_days_std", "category_diversity", "avg_order_value", "unique_days",
+)
+
 st.title("Customer Lifetime Value (CLTV) — Demo")
 st.markdown(
     "Enter a single customer (manual) or upload a CSV (batch) with features to get LTV predictions "
@@ -21,34 +35,97 @@ st.markdown(
 )
 
 # ========== Helper functions ==========
-def call_predict_api(payload: dict, api_url: str = API_URL, timeout: int = 120) -> List[Dict]:
-    url = api_url.rstrip("/") + "/predict"
+@st.cache_resource
+def _session() -> requests.Session:
+    # one keep-alive connection pool shared across reruns (skips the TLS handshake per click)
+    s = requests.Session()
+    # /predict has no side effects, so POST is safe to retry on gateway errors
+    retry = Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504],
+                  allowed_methods=frozenset({"POST"}), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+@st.cache_data(show_spinner=False)
+def _predict_url(base: str) -> str:
+    return base.strip().rstrip("/") + "/predict"
+
+JSON_HEADERS = {"Content-Type": "application/json", "Accept-Encoding": "gzip"}
+
+def _post_body(session: requests.Session, body: bytes, n_customers: int, url: str, timeout: int) -> List[Dict]:
+    # the API returns one item per customer in request order, so fill results by index
+    results = [None] * n_customers
+    n = 0
+    with session.post(url, data=body, headers=JSON_HEADERS, stream=True, timeout=timeout) as resp:
+        if not resp.ok:
+            resp.content  # buffer the error body so callers can still show it
+            resp.raise_for_status()
+        resp.raw.decode_content = True  # let urllib3 gunzip the stream
+        for n, item in enumerate(ijson.items(resp.raw, "item", use_float=True), start=1):
+            results[n - 1] = item
+    return results[:n]
+
+def _post_predict(session: requests.Session, payload: dict, url: str, timeout: int) -> List[Dict]:
+    # orjson writes NaN/inf as null (stdlib json wrote bare NaN), so payload builders must fill them first
+    body = orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return _post_body(session, body, len(payload["customers"]), url, timeout)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_predict(payload_key: bytes, n_customers: int, url: str, timeout: int) -> List[Dict]:
+    # payload_key is the sorted-key JSON of the payload: it is both the cache key and the request body
+    return _post_body(_session(), payload_key, n_customers, url, timeout)
+
+def call_predict_api(payload: dict, api_url: str = API_URL, timeout: int = 120, cache: bool = True) -> List[Dict]:
+    url = _predict_url(api_url)
+    try:
+        if cache:
+            payload_key = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+            return _cached_predict(payload_key, len(payload["customers"]), url, timeout)
+        return _post_predict(_session(), payload, url, timeout)
+    except requests.HTTPError as e:
+        st.error(f"HTTP error: {e} - {e.response.text if e.response is not None else ''}")
+        return []
+    except Exception as e:
+        st.error(f"Request failed: {e}")
+        return []
+
+def call_predict_api_batched(customers: List[Dict], api_url: str = API_URL, timeout: int = 120,
+                             chunk: int = 256, workers: int = 8, return_explanation: bool = True) -> List[Dict]:
+    # split large batches into chunks and POST them concurrently; results keep input order
+    url = _predict_url(api_url)
+    payloads = [
+        {"customers": customers[i:i + chunk], "return_explanation": return_explanation}
+        for i in range(0, len(customers), chunk)
+    ]
+    session = _session()  # resolve the cached resource on the script thread
     try:
-        resp = requests.post(url, json=payload, timeout=timeout)
-        resp.raise_for_status()
-        return resp.json()
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            parts = list(ex.map(lambda p: _post_predict(session, p, url, timeout), payloads))
     except requests.HTTPError as e:
         st.error(f"HTTP error: {e} - {e.response.text if e.response is not None else ''}")
         return []
     except Exception as e:
         st.error(f"Request failed: {e}")
         return []
+    return [r for part in parts for r in part]
 
-def single_payload_from_inputs(customer_id: str, inputs: dict) -> dict:
+def single_payload_from_inputs(customer_id: str, inputs: dict, return_explanation: bool = True) -> dict:
     cust = {"customer_id": customer_id}
     cust.update(inputs)
-    return {"customers": [cust], "return_explanation": True}
-
-def dataframe_to_payload(df: pd.DataFrame) -> dict:
-    # ensure columns are lowercased / expected names
-    customers = []
-    for _, row in df.iterrows():
-        d = row.to_dict()
-        # ensure customer_id exists
-        if "customer_id" not in d:
-            d["customer_id"] = str(row.name)
-        customers.append(d)
-    return {"customers": customers, "return_explanation": True}
+    return {"customers": [cust], "return_explanation": return_explanation}
+
+def dataframe_to_payload(df: pd.DataFrame, return_explanation: bool = True) -> dict:
+    # ensure customer_id exists (fall back to the row index)
+    if "customer_id" in df.columns:
+        ids = df["customer_id"].astype(str).to_numpy()
+    else:
+        ids = df.index.astype(str).to_numpy()
+    # one float32 matrix for all features; missing columns and empty cells get the API's 0.0 default
+    # (orjson would encode NaN as null, which the API rejects)
+    arr = df.reindex(columns=list(FEATURES), fill_value=0.0).to_numpy(dtype=np.float32, na_value=0.0)
+    customers = [dict(zip(FEATURES, row), customer_id=cid) for cid, row in zip(ids, arr.tolist())]
+    return {"customers": customers, "return_explanation": return_explanation}
 
 def show_explanation_bar(explanation: List[Dict], title: str = "Top features"):
     if not explanation:
@@ -56,15 +133,14 @@ def show_explanation_bar(explanation: List[Dict], title: str = "Top features"):
         return
     feats = [x["feature"] for x in explanation]
     impacts = [x["impact"] for x in explanation]
-    # normalize display order descending impacts
-    y_pos = range(len(feats))
-    fig, ax = plt.subplots(figsize=(6, 2.5))
-    ax.barh(y_pos, impacts[::-1])
-    ax.set_yticks(y_pos)
-    ax.set_yticklabels(feats[::-1])
-    ax.set_xlabel("Impact on predicted LTV (positive increases LTV)")
-    ax.set_title(title)
-    st.pyplot(fig)
+    # rendered client-side by Vega-Lite; no matplotlib figure / PNG round-trip.
+    # the API returns features by descending |impact|, and sort=None keeps that order top-down
+    df = pd.DataFrame({"feature": feats, "impact": impacts})
+    chart = alt.Chart(df, title=title).mark_bar().encode(
+        x=alt.X("impact:Q", title="Impact on predicted LTV (positive increases LTV)"),
+        y=alt.Y("feature:N", sort=None, title=None),
+    )
+    st.altair_chart(chart, use_container_width=True)
 
 # ========== Sidebar: API settings & sample payload ==========
 with st.sidebar:
@@ -85,25 +161,31 @@ API_URL = st.session_state.get("api_url_input", API_URL).strip() or API_URL
 # ========== Main: Manual single customer input ==========
 st.subheader("1) Predict for a single customer")
 
-col1, col2 = st.columns([1, 2])
-
-with col1:
-    cust_id = st.text_input("Customer ID", value="C101")
-    frequency = st.number_input("frequency", value=4.0, step=1.0)
-    total_spend = st.number_input("total_spend", value=200.0, step=1.0)
-    aov = st.number_input("aov", value=50.0, step=1.0)
-    recency_days = st.number_input("recency_days", value=20.0, step=1.0)
-    T_days = st.number_input("T_days", value=300.0, step=1.0)
-
-with col2:
-    avg_interpurchase_days = st.number_input("avg_interpurchase_days", value=100.0, step=1.0)
-    active_months = st.number_input("active_months", value=3.0, step=1.0)
-    purchase_days_std = st.number_input("purchase_days_std", value=12.0, step=1.0)
-    category_diversity = st.number_input("category_diversity", value=2.0, step=1.0)
-    avg_order_value = st.number_input("avg_order_value", value=50.0, step=1.0)
-    unique_days = st.number_input("unique_days", value=4.0, step=1.0)
-
-if st.button("Predict single customer"):
+# batch widget edits into one rerun on submit instead of one per keystroke
+with st.form("single_form"):
+    col1, col2 = st.columns([1, 2])
+
+    with col1:
+        cust_id = st.text_input("Customer ID", value="C101")
+        frequency = st.number_input("frequency", value=4.0, step=1.0)
+        total_spend = st.number_input("total_spend", value=200.0, step=1.0)
+        aov = st.number_input("aov", value=50.0, step=1.0)
+        recency_days = st.number_input("recency_days", value=20.0, step=1.0)
+        T_days = st.number_input("T_days", value=300.0, step=1.0)
+
+    with col2:
+        avg_interpurchase_days = st.number_input("avg_interpurchase_days", value=100.0, step=1.0)
+        active_months = st.number_input("active_months", value=3.0, step=1.0)
+        purchase_days_std = st.number_input("purchase_days_std", value=12.0, step=1.0)
+        category_diversity = st.number_input("category_diversity", value=2.0, step=1.0)
+        avg_order_value = st.number_input("avg_order_value", value=50.0, step=1.0)
+        unique_days = st.number_input("unique_days", value=4.0, step=1.0)
+
+    # SHAP is the most expensive per-row step on the server, so it is opt-in
+    explain = st.checkbox("Include SHAP explanations", value=False, key="explain_single")
+    submitted = st.form_submit_button("Predict single customer")
+
+if submitted:
     inputs = {
         "frequency": float(frequency),
         "total_spend": float(total_spend),
@@ -117,34 +199,49 @@ if st.button("Predict single customer"):
         "avg_order_value": float(avg_order_value),
         "unique_days": float(unique_days),
     }
-    payload = single_payload_from_inputs(cust_id, inputs)
+    payload = single_payload_from_inputs(cust_id, inputs, return_explanation=explain)
     st.info("Calling API...")
-    results = call_predict_api(payload, api_url=API_URL)
+    # only cache explained predictions; plain predictions are cheap to recompute
+    results = call_predict_api(payload, api_url=API_URL, cache=explain)
     if results:
         r = results[0]
         st.metric("Predicted LTV", f"{r['predicted_LTV']:.2f}")
         st.write("Segment:", r.get("segment"))
-        st.markdown("**Top features (impact)**")
-        show_explanation_bar(r.get("explanation", []))
+        if explain:
+            st.markdown("**Top features (impact)**")
+            show_explanation_bar(r.get("explanation", []))
 
 # ========== CSV Batch Upload ==========
 st.subheader("2) Batch: Upload CSV (columns must match feature names)")
 
-uploaded = st.file_uploader("Upload CSV with columns: customer_id, frequency, total_spend, aov, recency_days, T_days, avg_interpurchase_days, active_months, purchase_days_std, category_diversity, avg_order_value, unique_days", type=["csv"])
-if st.button("Predict from uploaded CSV") and uploaded is not None:
+with st.form("batch_form"):
+    uploaded = st.file_uploader("Upload CSV with columns: customer_id, frequency, total_spend, aov, recency_days, T_days, avg_interpurchase_days, active_months, purchase_days_std, category_diversity, avg_order_value, unique_days", type=["csv"])
+    batch_explain = st.checkbox("Include SHAP explanations", value=False, key="explain_batch")
+    batch_submitted = st.form_submit_button("Predict from uploaded CSV")
+
+if batch_submitted and uploaded is not None:
     try:
-        df = pd.read_csv(uploaded)
+        df = pd.read_csv(uploaded, engine="pyarrow", dtype_backend="pyarrow")
         st.write("Preview:", df.head())
-        payload = dataframe_to_payload(df)
+        payload = dataframe_to_payload(df, return_explanation=batch_explain)
         st.info(f"Calling API for {len(payload['customers'])} customers...")
-        results = call_predict_api(payload, api_url=API_URL)
+        results = call_predict_api_batched(payload["customers"], api_url=API_URL, return_explanation=batch_explain)
         if results:
-            out_df = pd.DataFrame(results)
-            # flatten explanation into string
-            out_df["top_features"] = out_df["explanation"].apply(lambda x: "; ".join([f'{d["feature"]}:{d["impact"]:.2f}' for d in x]) if x else "")
-            st.write("Results preview:", out_df.head())
-            csv = out_df.to_csv(index=False).encode("utf-8")
-            st.download_button("Download predictions CSV", data=csv, file_name="predictions_with_explanations.csv")
+            st.write("Results preview:", results[:5])
+            # write the download straight from an Arrow table
+            results_flat = [
+                {"customer_id": r["customer_id"], "predicted_LTV": r["predicted_LTV"], "segment": r.get("segment")}
+                for r in results
+            ]
+            if batch_explain:
+                # flatten explanation into string
+                for row, r in zip(results_flat, results):
+                    row["top_features"] = "; ".join(f'{d["feature"]}:{d["impact"]:.2f}' for d in r.get("explanation") or [])
+            buf = io.BytesIO()
+            pacsv.write_csv(pa.Table.from_pylist(results_flat), buf)
+            csv = buf.getvalue()
+            file_name = "predictions_with_explanations.csv" if batch_explain else "predictions.csv"
+            st.download_button("Download predictions CSV", data=csv, file_name=file_name)
     except Exception as e:
         st.error(f"Failed to read CSV: {e}")
 
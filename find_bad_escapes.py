@@ -4,65 +4,100 @@
 # (like '\U') in common text/code files and prints filename + line numbers.
 
 import os
-import fnmatch
+import mmap
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
 ROOT = os.path.abspath(os.path.dirname(__file__))
 
-# File patterns to check
-patterns = ["*.py", "*.txt", "*.md", "*.env", "Dockerfile", "*.yml", "*.yaml", "*.ini", "*.json"]
+# File types to check
+suffixes = (".py", ".txt", ".md", ".env", ".yml", ".yaml", ".ini", ".json")
+names = ("Dockerfile",)
 
-# suspicious substrings to search for (raw)
+# folders pruned before descending (virtual envs, .git, caches)
+SKIP = {".git", ".venv", "venv", "__pycache__"}
+
+# suspicious byte sequences to search for (raw)
 suspicious = [
-    "\\U",  # unicode escape start
-    "\\u",  # unicode escape
-    "C:\\\\Users",  # literal C:\Users (escaped for Python)
-    "C:\\Users",     # plain C:\Users
-    "\\\\",          # any double backslash occurrences
-    "\\n", "\\t",    # not always problematic but list them
+    b"\\U",  # unicode escape start
+    b"\\u",  # unicode escape
+    b"C:\\\\Users",  # literal C:\Users (escaped for Python)
+    b"C:\\Users",     # plain C:\Users
+    b"\\\\",          # any double backslash occurrences
+    b"\\n", b"\\t",    # not always problematic but list them
 ]
 
+# files up to this size are pulled in with a single buffered read; larger ones are mmapped
+READ_BUFFER = 1 << 20
+
+def scan_buffer(buf, hits):
+    # search the whole buffer per token, then map offsets back to lines
+    for needle in suspicious:
+        pos, line_no, counted = 0, 1, 0
+        while True:
+            off = buf.find(needle, pos)
+            if off == -1:
+                break
+            line_no += buf[counted:off].count(b"\n")
+            counted = off
+            start = buf.rfind(b"\n", 0, off) + 1
+            end = buf.find(b"\n", off)
+            if end == -1:
+                end = len(buf)
+            if line_no not in hits:
+                hits[line_no] = buf[start:end].rstrip(b"\r").decode(errors="replace")
+            pos = end + 1
+
 # Also check string-like contexts with single/double quotes
 def search_file(path):
-    results = []
+    hits = {}
     try:
-        with open(path, "r", errors="replace") as f:
-            for i, line in enumerate(f, start=1):
-                for token in suspicious:
-                    if token in line:
-                        results.append((i, line.rstrip("\n")))
-                        break
+        with open(path, "rb", buffering=READ_BUFFER) as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return []
+            if size <= READ_BUFFER:
+                scan_buffer(f.read(), hits)
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    scan_buffer(mm, hits)
     except Exception as e:
-        # skip binary
+        # skip unreadable files
         return []
-    return results
+    return sorted(hits.items())
+
+def walk(root):
+    # like os.walk, silently skip directories that cannot be listed
+    try:
+        it = os.scandir(root)
+    except OSError:
+        return
+    with it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name in SKIP:
+                    continue
+                yield from walk(entry.path)
+            elif entry.name.endswith(suffixes) or entry.name in names:
+                yield entry.path
 
-matches = {}
-for dirpath, dirnames, filenames in os.walk(ROOT):
-    # skip virtual env folders and .git
-    if any(part in (".git", ".venv", "venv", "__pycache__") for part in dirpath.split(os.sep)):
-        continue
-    for pat in patterns:
-        for filename in fnmatch.filter(filenames, pat):
-            path = os.path.join(dirpath, filename)
-            res = search_file(path)
+if __name__ == "__main__":
+    paths = list(walk(ROOT))
+    matches = {}
+    # files are independent, so scan them across all cores
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        for path, res in zip(paths, ex.map(search_file, paths, chunksize=32)):
             if res:
                 matches[path] = res
-    # check Dockerfile explicitly
-    if "Dockerfile" in filenames:
-        path = os.path.join(dirpath, "Dockerfile")
-        res = search_file(path)
-        if res:
-            matches[path] = res
 
-if not matches:
-    print("No suspicious backslash patterns found in scanned files.")
-    sys.exit(0)
+    if not matches:
+        print("No suspicious backslash patterns found in scanned files.")
+        sys.exit(0)
 
-print("Found suspicious patterns in the following files (line: content):\n")
-for path, hits in matches.items():
-    print("----", path)
-    for lineno, content in hits:
-        # show with escaped backslashes visible
-        print(f"{lineno}: {content}")
-    print()
+    print("Found suspicious patterns in the following files (line: content):\n")
+    for path, hits in matches.items():
+        print("----", path)
+        for lineno, content in hits:
+            # show with escaped backslashes visible
+            print(f"{lineno}: {content}")
+        print()